@@ -0,0 +1,316 @@
+"""Read-only JSON HTTP API over the cached merchant database.
+
+Serves the same data as the ``get_cached_*`` functions so bots and
+spreadsheets don't have to scrape the Streamlit page. Run it next to the app:
+
+    python api.py --port 8502
+
+Endpoints: ``/merchants``, ``/items``, ``/locations`` and ``/tags``.
+Query parameters ``page`` and ``per_page`` paginate the results and
+``format=ndjson`` (or ``Accept: application/x-ndjson``) streams one JSON row
+per line. Responses carry ETags, so polling clients get cheap 304s.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from database import (
+    get_cached_merchants, get_cached_items, get_cached_locations,
+    get_cache_version, invalidate_cache
+)
+
+
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+# Rows per chunk when streaming NDJSON
+STREAM_CHUNK_ROWS = 500
+
+
+def _get_tags():
+    """Return the sorted unique tags of the cached items."""
+    return sorted({item['tag'] for item in get_cached_items()})
+
+
+# Endpoint path -> function returning the full list of rows
+ENDPOINTS = {
+    '/merchants': get_cached_merchants,
+    '/items': get_cached_items,
+    '/locations': get_cached_locations,
+    '/tags': _get_tags,
+}
+
+# (path, cache version) -> content digest of that table
+_DIGESTS = {}
+_digests_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+
+
+def refresh_cache(max_age):
+    """Drop the cache if it is older than max_age seconds.
+
+    The API runs in its own process, so it cannot see the Streamlit app
+    invalidating its cache; reloading periodically keeps the two in step.
+    """
+    global _last_refresh
+    with _refresh_lock:
+        now = time.monotonic()
+        if now - _last_refresh >= max_age:
+            if _last_refresh:
+                invalidate_cache()
+            _last_refresh = now
+
+
+def get_table(path):
+    """Return the rows and content digest for an endpoint.
+
+    The digest is computed once per cache version, so an unchanged table keeps
+    the same ETag across cache reloads.
+    """
+    # Read the version first: if the cache is reloaded while the rows are
+    # read, the rows may be newer than the version but never older
+    version = get_cache_version()
+    rows = ENDPOINTS[path]()
+    key = (path, version)
+    # A reload meanwhile means the rows may not match the memoized digest
+    current = get_cache_version() == version
+    with _digests_lock:
+        digest = _DIGESTS.get(key) if current else None
+    if digest is None:
+        payload = json.dumps(rows, sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        if current:
+            with _digests_lock:
+                # Older versions will never be asked for again
+                for old_key in [k for k in _DIGESTS if k[0] == path and k[1] < version]:
+                    del _DIGESTS[old_key]
+                _DIGESTS[key] = digest
+    return rows, digest
+
+
+def paginate(rows, page, per_page):
+    """Return the rows for a 1-based page, or all rows if per_page is None."""
+    if per_page is None:
+        return rows
+    start = (page - 1) * per_page
+    return rows[start:start + per_page]
+
+
+def choose_encoding(accept_encoding):
+    """Pick the best supported content encoding from an Accept-Encoding header.
+
+    Returns:
+        'br', 'gzip' or None for identity
+    """
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag.removeprefix('W/')
+    return any(tag.strip().removeprefix('W/') == bare for tag in if_none_match.split(','))
+
+
+class _StreamCompressor:
+    """Incremental compressor for chunked responses."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor()
+        elif encoding == 'gzip':
+            self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        else:
+            self._compressor = None
+
+    def compress(self, data):
+        if self._compressor is None:
+            return data
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._compressor is None:
+            return b''
+        return self._compressor.finish() if self.encoding == 'br' else self._compressor.flush()
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Request handler for the read-only API"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ApogeaAPI/0.1'
+    max_age = 30
+
+    def do_HEAD(self):
+        self.handle_get(head_only=True)
+
+    def do_GET(self):
+        self.handle_get()
+
+    def handle_get(self, head_only=False):
+        url = urlsplit(self.path)
+        path = url.path.rstrip('/') or '/'
+        if path == '/':
+            self.send_json(200, {'endpoints': sorted(ENDPOINTS)}, head_only)
+            return
+        if path not in ENDPOINTS:
+            self.send_json(404, {'error': f"Unknown endpoint '{path}'"}, head_only)
+            return
+
+        query = parse_qs(url.query)
+        ndjson = (
+            query.get('format', [''])[0] == 'ndjson'
+            or 'application/x-ndjson' in self.headers.get('Accept', '')
+        )
+        try:
+            page = int(query.get('page', ['1'])[0])
+            per_page = query.get('per_page', [None])[0]
+            if per_page is not None:
+                per_page = int(per_page)
+            elif not ndjson or 'page' in query:
+                per_page = DEFAULT_PER_PAGE
+        except ValueError:
+            self.send_json(400, {'error': 'page and per_page must be integers'}, head_only)
+            return
+        if page < 1 or (per_page is not None and not 1 <= per_page <= MAX_PER_PAGE):
+            self.send_json(
+                400, {'error': f'page must be >= 1 and per_page between 1 and {MAX_PER_PAGE}'},
+                head_only
+            )
+            return
+
+        refresh_cache(self.max_age)
+        rows, digest = get_table(path)
+        variant = f"{digest}:{page}:{per_page}:{'ndjson' if ndjson else 'json'}"
+        etag = 'W/"%s"' % hashlib.sha1(variant.encode('utf-8')).hexdigest()[:32]
+
+        if etag_matches(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_common_headers(etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        rows_page = paginate(rows, page, per_page)
+        encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+        if ndjson:
+            self.stream_ndjson(rows_page, etag, encoding, head_only)
+            return
+
+        body = {'data': rows_page, 'page': page, 'per_page': per_page, 'total': len(rows)}
+        self.send_json(200, body, head_only, etag=etag, encoding=encoding)
+
+    def send_common_headers(self, etag=None):
+        self.send_header('Vary', 'Accept, Accept-Encoding')
+        if etag:
+            self.send_header('ETag', etag)
+            # Clients may keep the response but must revalidate before reuse
+            self.send_header('Cache-Control', 'no-cache')
+
+    def send_json(self, status, body, head_only=False, etag=None, encoding=None):
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        if len(data) < MIN_COMPRESS_SIZE:
+            encoding = None
+        if encoding == 'br':
+            data = brotli.compress(data)
+        elif encoding == 'gzip':
+            data = gzip.compress(data)
+
+        self.send_response(status)
+        self.send_common_headers(etag)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(data)
+
+    def stream_ndjson(self, rows, etag, encoding, head_only=False):
+        self.send_response(200)
+        self.send_common_headers(etag)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        if head_only:
+            return
+
+        compressor = _StreamCompressor(encoding)
+        for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+            lines = ''.join(
+                json.dumps(row, separators=(',', ':')) + '\n'
+                for row in rows[start:start + STREAM_CHUNK_ROWS]
+            )
+            self.write_chunk(compressor.compress(lines.encode('utf-8')))
+        self.write_chunk(compressor.finish())
+        # Zero-length chunk terminates the response
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        """Write one chunk of a chunked response, skipping empty data."""
+        if data:
+            self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only JSON API for the merchant database")
+    parser.add_argument('--host', default='0.0.0.0', help="Interface to bind (default: 0.0.0.0)")
+    parser.add_argument('--port', type=int, default=8502, help="Port to listen on (default: 8502)")
+    parser.add_argument(
+        '--max-age', type=float, default=30,
+        help="Seconds before cached tables are reloaded from the database (default: 30)"
+    )
+    args = parser.parse_args()
+
+    ApiHandler.max_age = args.max_age
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    print(f"Serving merchant API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,33 @@
+import psycopg2
 import streamlit as st
-from database import initialize_database, load_all_tables_to_cache
+import replica
+from database import (
+    initialize_database, load_all_tables_to_cache, is_primary_offline, pop_write_errors
+)
+from profiling import begin_rerun, end_rerun
 from ui_components import (
     render_add_merchant_form,
     render_merchants_list,
     render_add_item_form,
     render_items_list,
-    render_merchants_selling_item_tab
+    render_merchants_selling_item_tab,
+    render_bulk_price_editor,
+    render_merchants_buying_items_tab
 )
 
 
+# Opt-in per-render profiling (PROFILING secret; "query" limits it to ?profile=1)
+begin_rerun()
+
 # Initialize database and preload cache on first run
 if 'db_initialized' not in st.session_state:
     st.session_state.db_initialized = True
-    initialize_database()
+    try:
+        initialize_database()
+    except psycopg2.OperationalError:
+        # Primary unreachable: carry on from the local replica if we have one
+        if not replica.has_data():
+            raise
     load_all_tables_to_cache()
 
 # Streamlit UI
@@ -21,8 +36,17 @@ st.set_page_config(page_title="Merchant Database", page_icon="🏪", layout="wid
 st.title("🏪 Merchant Database")
 st.markdown("Add merchants and track what they buy and sell")
 
+if is_primary_offline():
+    st.warning("⚠️ Database unreachable. Showing the local copy; changes can't be saved right now.")
+
+# Report queued writes that failed to save since the last rerun
+for error in pop_write_errors():
+    st.error(f"❌ {error}")
+
 # Create tabs
-tab1, tab2, tab3 = st.tabs(["📦 Items", "🏪 Merchants", "🔎 Who Sells?"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["📦 Items", "🏪 Merchants", "🔎 Who Sells?", "💰 Who Buys?", "✏️ Edit Prices"]
+)
 
 with tab1:
     col1, col2 = st.columns([1, 1])
@@ -39,4 +63,12 @@ with tab2:
         render_merchants_list()
 
 with tab3:
-    render_merchants_selling_item_tab()
\ No newline at end of file
+    render_merchants_selling_item_tab()
+
+with tab4:
+    render_merchants_buying_items_tab()
+
+with tab5:
+    render_bulk_price_editor()
+
+end_rerun()
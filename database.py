@@ -1,8 +1,16 @@
 
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
+import functools
 import json
+import threading
+import time
+from collections import namedtuple, OrderedDict
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import migrations
+import replica
 
 # Global cache for table data
 _CACHE = {
@@ -11,11 +19,162 @@ _CACHE = {
     'locations': None
 }
 
+# Bumped every time a cached table is invalidated, so readers (e.g. the
+# HTTP API) can tell whether cached data changed since they last looked
+_CACHE_VERSION = 0
+
+def invalidate_cache(*tables):
+    """Drop the given tables (or all tables) from the cache.
+
+    Args:
+        tables: Names of the cached tables to drop, all of them if omitted
+    """
+    global _CACHE_VERSION
+    for table in tables or _CACHE.keys():
+        _CACHE[table] = None
+    _CACHE_VERSION += 1
+
+def get_cache_version():
+    """Return the current cache version number."""
+    return _CACHE_VERSION
+
+# Local replica state: whether this process has booted from it yet, and
+# whether the last attempt to reach the primary failed
+_replica_booted = False
+_primary_offline = False
+_sync_lock = threading.Lock()
+
+# Seconds to wait for the primary to accept a connection
+PRIMARY_CONNECT_TIMEOUT = 5
+
+# Seconds after failing to reach the primary before trying it again; until
+# then sessions are served from the local replica without waiting on it
+PRIMARY_RETRY_INTERVAL = 30
+_primary_retry_at = 0.0
+
+def _mark_primary_offline():
+    """Record that the primary is unreachable and back off from it"""
+    global _primary_offline, _primary_retry_at
+    _primary_offline = True
+    _primary_retry_at = time.monotonic() + PRIMARY_RETRY_INTERVAL
+
+def _primary_backing_off():
+    """Return True if the primary failed recently and shouldn't be retried yet"""
+    return _primary_offline and time.monotonic() < _primary_retry_at
+
 def load_all_tables_to_cache():
-    """Load all tables into the global cache at startup."""
-    _CACHE['merchants'] = get_all_merchants()
-    _CACHE['items'] = get_all_items()
-    _CACHE['locations'] = get_all_locations()
+    """Load all tables into the global cache at startup.
+
+    With the local replica enabled, the first load in a process is served
+    straight from the replica while a background thread catches it up with
+    the primary. Later loads (after a write invalidated the cache) sync the
+    small delta first, so the writer sees their own change. If the primary is
+    unreachable, the replica is served as is, and the primary isn't retried
+    for PRIMARY_RETRY_INTERVAL seconds.
+    """
+    global _replica_booted
+    if not replica.is_enabled():
+        _CACHE['merchants'] = get_all_merchants()
+        _CACHE['items'] = get_all_items()
+        _CACHE['locations'] = get_all_locations()
+        _after_cache_load()
+        return
+
+    boot_from_replica = not _replica_booted and replica.has_data()
+    _replica_booted = True
+    if not boot_from_replica and not (_primary_backing_off() and replica.has_data()):
+        try:
+            sync_local_replica()
+        except psycopg2.OperationalError:
+            if not replica.has_data():
+                raise
+            _mark_primary_offline()
+    _CACHE.update(replica.load_tables())
+    _after_cache_load()
+    if boot_from_replica:
+        threading.Thread(target=_background_sync, daemon=True).start()
+
+def sync_local_replica():
+    """Pull changes from the primary into the local replica
+
+    Returns:
+        Number of replica rows that changed
+    """
+    global _primary_offline
+    with _sync_lock:
+        conn = get_connection()
+        try:
+            changed = replica.sync_from_primary(conn)
+        finally:
+            return_connection(conn)
+    _primary_offline = False
+    return changed
+
+def _background_sync():
+    """Catch the replica up after booting from it and refresh the cache"""
+    global _CACHE_VERSION
+    try:
+        changed = sync_local_replica()
+    except Exception:
+        # Primary unreachable: keep serving the replica
+        _mark_primary_offline()
+        return
+    if changed:
+        _CACHE.update(replica.load_tables())
+        _after_cache_load()
+        _CACHE_VERSION += 1
+
+def is_primary_offline():
+    """Return True if data is being served from the local replica because
+    the primary database could not be reached"""
+    return _primary_offline
+
+# Tag -> {merchant name: location} for every merchant buying that tag.
+# Never modified in place: writers build a new index and swap it in, so
+# readers can use whatever index they picked up without locking.
+_TAG_INDEX = {}
+_tag_index_lock = threading.Lock()
+
+def _after_cache_load():
+    """Re-apply queued writes the fresh data may not include, then reindex"""
+    with _write_lock:
+        for op in _INFLIGHT_WRITES + list(_WRITE_QUEUE.values()):
+            _apply_optimistic(op)
+    _rebuild_tag_index()
+
+def _build_tag_index(merchants):
+    """Return a tag index of the given merchants"""
+    index = {}
+    for merchant in merchants:
+        for tag in merchant['buy']:
+            index.setdefault(tag, {})[merchant['name']] = merchant['location'] or ''
+    return index
+
+def _rebuild_tag_index():
+    """Rebuild the tag index from the cached merchants"""
+    global _TAG_INDEX
+    index = _build_tag_index(_CACHE['merchants'] or [])
+    with _tag_index_lock:
+        _TAG_INDEX = index
+
+def _index_merchant(name, location, buy_tags):
+    global _TAG_INDEX
+    with _tag_index_lock:
+        index = dict(_TAG_INDEX)
+        for tag in buy_tags:
+            index[tag] = {**index.get(tag, {}), name: location or ''}
+        _TAG_INDEX = index
+
+def _unindex_merchant(name):
+    global _TAG_INDEX
+    with _tag_index_lock:
+        index = {}
+        for tag, merchants in _TAG_INDEX.items():
+            if name in merchants:
+                merchants = {m: loc for m, loc in merchants.items() if m != name}
+            if merchants:
+                index[tag] = merchants
+        _TAG_INDEX = index
 
 def get_cached_merchants():
     """Return cached merchants list."""
@@ -36,6 +195,14 @@ def get_cached_locations():
     return _CACHE['locations']
 
 
+# Compact row records yielded by the streaming iter_* functions
+MerchantRow = namedtuple('MerchantRow', ['name', 'location', 'buy', 'sell'])
+ItemRow = namedtuple('ItemRow', ['id', 'name', 'weight', 'tag', 'icon'])
+
+# Rows fetched per round trip by server-side cursors
+STREAM_ITERSIZE = 2000
+
+
 # Connection pool for efficient database connections
 connection_pool = None
 
@@ -51,58 +218,43 @@ def get_connection_pool():
         
         connection_pool = pool.SimpleConnectionPool(
             1, 10,  # min and max connections
-            database_url
+            database_url,
+            connect_timeout=PRIMARY_CONNECT_TIMEOUT
         )
     return connection_pool
 
+# Set once the schema has been brought up to date in this process
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 def initialize_database():
-    """Create database and tables if they don't exist"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS merchants (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            location TEXT,
-            buy_tags TEXT,
-            sell_items TEXT
-        )
-    ''')
-    
-    # Add location column if it doesn't exist (for existing databases)
-    cursor.execute("""
-        DO $$ 
-        BEGIN
-            IF NOT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name='merchants' AND column_name='location'
-            ) THEN
-                ALTER TABLE merchants ADD COLUMN location TEXT;
-            END IF;
-        END $$;
-    """)
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS items (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL,
-            weight REAL NOT NULL,
-            tag TEXT NOT NULL,
-            icon TEXT
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS locations (
-            id SERIAL PRIMARY KEY,
-            name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    
-    conn.commit()
-    cursor.close()
-    return_connection(conn)
+    """Bring the database schema up to date, once per process
+
+    Sessions after the first don't touch the database at all. See
+    migrations.py for the migrations and the deploy-time CLI.
+
+    Raises:
+        psycopg2.OperationalError: The primary is unreachable, or failed
+            within the last PRIMARY_RETRY_INTERVAL seconds
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    if _primary_backing_off():
+        raise psycopg2.OperationalError("primary database unreachable; will retry shortly")
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            conn = get_connection()
+            try:
+                migrations.migrate(conn)
+            finally:
+                return_connection(conn)
+        except psycopg2.OperationalError:
+            _mark_primary_offline()
+            raise
+        _schema_ready = True
 
 
 def get_connection():
@@ -115,6 +267,226 @@ def return_connection(conn):
     pool = get_connection_pool()
     pool.putconn(conn)
 
+def _get_write_connection():
+    """Get a primary connection for a write, or None if the primary is offline
+
+    While the primary is backing off (see _mark_primary_offline) writes fail
+    at once instead of each waiting for the connect timeout.
+    """
+    if _primary_backing_off():
+        return None
+    try:
+        return get_connection()
+    except psycopg2.OperationalError:
+        _mark_primary_offline()
+        return None
+
+def _write_failed(conn):
+    """Back off from the primary if a failed write lost its connection"""
+    if conn.closed:
+        _mark_primary_offline()
+
+
+# Optional read replicas (DATABASE_READ_URLS in secrets). Bulk reads go to a
+# healthy replica, round robin; writes and everything else use the primary.
+
+# Seconds between replication lag checks of each replica
+READ_REPLICA_CHECK_INTERVAL = 5
+
+# Seconds to wait when connecting to a replica, so an unreachable one doesn't
+# hold up reads for long before they fall back to the primary
+READ_REPLICA_CONNECT_TIMEOUT = 2
+
+# Replica lag in seconds: 0 when it has replayed everything it received,
+# NULL when it is not streaming from the primary at all
+_READ_REPLICA_LAG_SQL = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+'''
+
+# Replica URL -> {'pool', 'healthy', 'checked_at'}
+read_replicas = None
+_read_replica_lock = threading.Lock()
+_next_read_replica = 0
+# Connection -> replica pool it was taken from
+_read_connection_pools = {}
+# Monotonic time of the last write by this process, and by each session
+_last_write_at = None
+_session_writes = {}
+_read_local = threading.local()
+
+def get_read_replicas():
+    """Return the configured read replicas, keyed by URL"""
+    global read_replicas
+    if read_replicas is None:
+        urls = st.secrets.get("DATABASE_READ_URLS", [])
+        if isinstance(urls, str):
+            urls = [url.strip() for url in urls.split(',') if url.strip()]
+        read_replicas = {
+            url: {'pool': None, 'healthy': False, 'checked_at': None}
+            for url in urls
+        }
+    return read_replicas
+
+def _mark_write(session_ids=None):
+    """Record a write so the writer's next reads go to the primary
+
+    Args:
+        session_ids: Sessions that made the write, defaults to the current one
+    """
+    global _last_write_at
+    now = time.monotonic()
+    window = float(st.secrets.get("READ_YOUR_WRITES_SECONDS", 5))
+    with _read_replica_lock:
+        _last_write_at = now
+        for session_id in session_ids or {_current_session_id()}:
+            _session_writes[session_id] = now
+        for session_id, written_at in list(_session_writes.items()):
+            if now - written_at >= window:
+                del _session_writes[session_id]
+
+def _reads_stick_to_primary(shared):
+    """Return True if a read must see recent writes the replicas may lack
+
+    Shared reads feed the process-wide cache, so any session's write counts;
+    other reads only stick after the current session's own writes.
+    """
+    window = float(st.secrets.get("READ_YOUR_WRITES_SECONDS", 5))
+    last = _last_write_at if shared else _session_writes.get(_current_session_id())
+    return last is not None and time.monotonic() - last < window
+
+def _mark_read_replica_down(url):
+    """Stop routing reads to a replica until its next lag check"""
+    state = read_replicas[url]
+    state['healthy'] = False
+    if state['pool'] is not None:
+        try:
+            state['pool'].closeall()
+        except pool.PoolError:
+            pass
+        state['pool'] = None
+
+def _check_read_replica(url):
+    """Connect to a replica if needed and check its replication lag
+
+    Runs without _read_replica_lock held, so a slow or unreachable replica
+    doesn't stall other reads and writes; callers claim the check first by
+    setting its checked_at.
+    """
+    state = read_replicas[url]
+    max_lag = float(st.secrets.get("REPLICA_MAX_LAG_SECONDS", 5))
+    read_pool = state['pool']
+    try:
+        if read_pool is None:
+            read_pool = pool.SimpleConnectionPool(
+                1, 10, url, connect_timeout=READ_REPLICA_CONNECT_TIMEOUT
+            )
+        conn = read_pool.getconn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(_READ_REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+            cursor.close()
+            conn.rollback()
+        finally:
+            read_pool.putconn(conn)
+    except psycopg2.Error:
+        with _read_replica_lock:
+            _mark_read_replica_down(url)
+        if read_pool is not None and not read_pool.closed:
+            read_pool.closeall()
+        return
+    with _read_replica_lock:
+        state['pool'] = read_pool
+        state['healthy'] = lag is not None and lag <= max_lag
+
+def get_read_connection(shared=False):
+    """Get a connection for read-only queries
+
+    Uses a healthy read replica when one is configured, and the primary if
+    none is, if all are lagging or unreachable, or right after a write (so
+    writers read their own changes).
+
+    Args:
+        shared: True if the result is cached for every session
+
+    Returns:
+        Connection to pass back to return_read_connection
+    """
+    global _next_read_replica
+    _read_local.replica_url = None
+    replicas = get_read_replicas()
+    if replicas and not _reads_stick_to_primary(shared):
+        urls = list(replicas)
+        for offset in range(len(urls)):
+            with _read_replica_lock:
+                url = urls[(_next_read_replica + offset) % len(urls)]
+                state = replicas[url]
+                # Claim a due check so only this caller runs it
+                check_due = (
+                    state['checked_at'] is None
+                    or time.monotonic() - state['checked_at'] >= READ_REPLICA_CHECK_INTERVAL
+                )
+                if check_due:
+                    state['checked_at'] = time.monotonic()
+            if check_due:
+                _check_read_replica(url)
+            with _read_replica_lock:
+                read_pool = state['pool'] if state['healthy'] else None
+            if read_pool is None:
+                continue
+            try:
+                # May open a new connection, so not under the lock either
+                conn = read_pool.getconn()
+            except pool.PoolError:
+                # Replica pool exhausted or just closed; try the next one
+                continue
+            except psycopg2.OperationalError:
+                with _read_replica_lock:
+                    _mark_read_replica_down(url)
+                continue
+            with _read_replica_lock:
+                _next_read_replica = (_next_read_replica + offset + 1) % len(urls)
+                _read_connection_pools[conn] = read_pool
+            _read_local.replica_url = url
+            _read_local.connection = conn
+            return conn
+    return get_connection()
+
+def return_read_connection(conn):
+    """Return a connection from get_read_connection to its pool"""
+    with _read_replica_lock:
+        read_pool = _read_connection_pools.pop(conn, None)
+    if read_pool is None:
+        return_connection(conn)
+        return
+    try:
+        read_pool.putconn(conn)
+    except pool.PoolError:
+        # The replica's pool was closed after it failed
+        conn.close()
+
+def _read_with_fallback(func):
+    """Retry a read on the primary if its replica fails mid-query"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except psycopg2.OperationalError:
+            url = getattr(_read_local, 'replica_url', None)
+            if url is None:
+                raise
+            with _read_replica_lock:
+                # The failed connection is never returned; forget it
+                _read_connection_pools.pop(_read_local.connection, None)
+                _mark_read_replica_down(url)
+            return func(*args, **kwargs)
+    return wrapper
+
 
 def add_merchant(name, location, buy_tags, sell_items):
     """Add a merchant to the database
@@ -126,9 +498,12 @@ def add_merchant(name, location, buy_tags, sell_items):
         sell_items: List of [item_name, price] pairs
         
     Returns:
-        True if successful, False if merchant already exists
+        True if successful, False if merchant already exists or the
+        database is unreachable (see is_primary_offline)
     """
-    conn = get_connection()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
     cursor = conn.cursor()
     
     try:
@@ -137,16 +512,20 @@ def add_merchant(name, location, buy_tags, sell_items):
             (name, location, json.dumps(buy_tags), json.dumps(sell_items))
         )
         conn.commit()
-        cursor.close()
-        return_connection(conn)
-        # Invalidate cache
-        _CACHE['merchants'] = None
-        return True
     except psycopg2.IntegrityError:
         conn.rollback()
+        return False
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    finally:
         cursor.close()
         return_connection(conn)
-        return False
+    _index_merchant(name, location, buy_tags)
+    _mark_write()
+    # Invalidate cache
+    invalidate_cache('merchants')
+    return True
 
 def delete_merchant(name):
     """Delete a merchant from the database by its unique name
@@ -157,28 +536,44 @@ def delete_merchant(name):
     Returns:
         True if a merchant was deleted, False otherwise
     """
-    conn = get_connection()
+    # Otherwise a queued write could re-create the merchant after the delete
+    dropped_add = _drop_queued_writes(name)
+    conn = _get_write_connection()
+    if conn is None:
+        if dropped_add:
+            invalidate_cache('merchants')
+        return dropped_add
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM merchants WHERE name = %s", (name,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    cursor.close()
-    return_connection(conn)
+    try:
+        cursor.execute("DELETE FROM merchants WHERE name = %s", (name,))
+        deleted = cursor.rowcount > 0 or dropped_add
+        conn.commit()
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    finally:
+        cursor.close()
+        return_connection(conn)
+    if deleted:
+        _unindex_merchant(name)
+    _mark_write()
     # Invalidate cache
-    _CACHE['merchants'] = None
+    invalidate_cache('merchants')
     return deleted
 
+@_read_with_fallback
 def get_all_merchants():
     """Get all merchants from database
     
     Returns:
         List of merchant dictionaries with name, location, buy tags, and sell items
     """
-    conn = get_connection()
+    conn = get_read_connection(shared=True)
     cursor = conn.cursor()
     cursor.execute("SELECT name, location, buy_tags, sell_items FROM merchants")
     merchants = []
-    for row in cursor.fetchall():
+    # Iterate the cursor rather than fetchall() to avoid a second full row list
+    for row in cursor:
         merchants.append({            
             'name': row[0],
             'location': row[1] or '',
@@ -186,7 +581,94 @@ def get_all_merchants():
             'sell': json.loads(row[3])
         })
     cursor.close()
-    return_connection(conn)
+    return_read_connection(conn)
+    return merchants
+
+def iter_merchants(itersize=STREAM_ITERSIZE):
+    """Stream all merchants from the database with a server-side cursor
+
+    Only itersize rows are held in memory at a time, so large tables can be
+    processed in constant memory. The connection is held until the generator
+    is exhausted or closed.
+
+    Args:
+        itersize: Number of rows fetched per round trip
+
+    Yields:
+        MerchantRow records with name, location, buy tags, and sell items
+    """
+    conn = get_connection()
+    cursor = conn.cursor(name='iter_merchants')
+    cursor.itersize = itersize
+    try:
+        cursor.execute("SELECT name, location, buy_tags, sell_items FROM merchants")
+        for row in cursor:
+            yield MerchantRow(row[0], row[1] or '', json.loads(row[2]), json.loads(row[3]))
+    finally:
+        cursor.close()
+        # Server-side cursors live in a transaction; end it before reuse
+        conn.rollback()
+        return_connection(conn)
+
+
+def get_buying_merchants(item_names):
+    """Find the merchants that buy each of the given items, using the tag index
+
+    Each item costs one index lookup on its tag, so a whole inventory is
+    answered in a single pass without scanning every merchant. If a write
+    has just dropped the cached merchants, only the merchants buying these
+    tags are fetched (via the GIN index) instead of reloading all of them.
+
+    Args:
+        item_names: Names of the items to sell
+
+    Returns:
+        Dictionary of location -> {merchant name: list of item names it buys}
+    """
+    tags_by_item = {item['name']: item['tag'] for item in get_cached_items()}
+    index = None
+    # Queued writes aren't in the database yet, so they need the cache
+    if _CACHE['merchants'] is None and not _primary_offline and not (_WRITE_QUEUE or _INFLIGHT_WRITES):
+        tags = {tags_by_item[name] for name in item_names if name in tags_by_item}
+        try:
+            index = _build_tag_index(find_merchants_buying_tags(tags)) if tags else {}
+        except psycopg2.OperationalError:
+            index = None
+    if index is None:
+        get_cached_merchants()  # make sure the cache and index are loaded
+        index = _TAG_INDEX
+    buyers = {}
+    for item_name in item_names:
+        tag = tags_by_item.get(item_name)
+        for merchant, location in index.get(tag, {}).items():
+            buyers.setdefault(location, {}).setdefault(merchant, []).append(item_name)
+    return buyers
+
+@_read_with_fallback
+def find_merchants_buying_tags(tags):
+    """Query the database for merchants that buy any of the given tags
+
+    Uses the GIN index on buy_tags, so it doesn't scan every merchant.
+
+    Args:
+        tags: List of item tags
+
+    Returns:
+        List of merchant dictionaries with name, location, and buy tags
+    """
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    # The (buy_tags::jsonb) expression must match the index definition
+    cursor.execute(
+        "SELECT name, location, buy_tags FROM merchants WHERE (buy_tags::jsonb) ?| %s::text[]",
+        (list(tags),)
+    )
+    merchants = [
+        {'name': row[0], 'location': row[1] or '', 'buy': json.loads(row[2])}
+        for row in cursor
+    ]
+    cursor.close()
+    return_read_connection(conn)
     return merchants
 
 
@@ -200,9 +682,12 @@ def add_item(name, weight, tag, icon=""):
         icon: Optional icon/emoji for the item
         
     Returns:
-        True if successful, False if item already exists
+        True if successful, False if item already exists or the database
+        is unreachable (see is_primary_offline)
     """
-    conn = get_connection()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
     cursor = conn.cursor()
     
     try:
@@ -211,16 +696,19 @@ def add_item(name, weight, tag, icon=""):
             (name, weight, tag, icon)
         )
         conn.commit()
-        cursor.close()
-        return_connection(conn)
-        # Invalidate cache
-        _CACHE['items'] = None
-        return True
     except psycopg2.IntegrityError:
         conn.rollback()
+        return False
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    finally:
         cursor.close()
         return_connection(conn)
-        return False
+    _mark_write()
+    # Invalidate cache
+    invalidate_cache('items')
+    return True
 
 def delete_item(name):
     """Delete an item from the database by its unique name
@@ -231,28 +719,38 @@ def delete_item(name):
     Returns:
         True if an item was deleted, False otherwise
     """
-    conn = get_connection()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
     cursor = conn.cursor()
-    cursor.execute("DELETE FROM items WHERE name = %s", (name,))
-    deleted = cursor.rowcount > 0
-    conn.commit()
-    cursor.close()
-    return_connection(conn)
+    try:
+        cursor.execute("DELETE FROM items WHERE name = %s", (name,))
+        deleted = cursor.rowcount > 0
+        conn.commit()
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    finally:
+        cursor.close()
+        return_connection(conn)
+    _mark_write()
     # Invalidate cache
-    _CACHE['items'] = None
+    invalidate_cache('items')
     return deleted
 
+@_read_with_fallback
 def get_all_items():
     """Get all items from database
     
     Returns:
         List of item dictionaries with id, name, weight, tag, and icon
     """
-    conn = get_connection()
+    conn = get_read_connection(shared=True)
     cursor = conn.cursor()
     cursor.execute("SELECT id, name, weight, tag, icon FROM items")
     items = []
-    for row in cursor.fetchall():
+    # Iterate the cursor rather than fetchall() to avoid a second full row list
+    for row in cursor:
         items.append({
             'id': row[0],
             'name': row[1],
@@ -261,21 +759,53 @@ def get_all_items():
             'icon': row[4]
         })
     cursor.close()
-    return_connection(conn)
+    return_read_connection(conn)
     return items    
 
+def iter_items(itersize=STREAM_ITERSIZE):
+    """Stream all items from the database with a server-side cursor
+
+    Args:
+        itersize: Number of rows fetched per round trip
+
+    Yields:
+        ItemRow records with id, name, weight, tag, and icon
+    """
+    conn = get_connection()
+    cursor = conn.cursor(name='iter_items')
+    cursor.itersize = itersize
+    try:
+        cursor.execute("SELECT id, name, weight, tag, icon FROM items")
+        for row in cursor:
+            yield ItemRow(*row)
+    finally:
+        cursor.close()
+        # Server-side cursors live in a transaction; end it before reuse
+        conn.rollback()
+        return_connection(conn)
+
+@_read_with_fallback
 def get_all_tags():
     """Get all unique tags from items in the database
 
+    While the primary is unreachable, the tags of the cached items are
+    returned instead.
+
     Returns:
         List of unique tag strings
     """
-    conn = get_connection()
+    if _primary_backing_off():
+        return list({item['tag'] for item in get_cached_items()})
+    try:
+        conn = get_read_connection()
+    except psycopg2.OperationalError:
+        _mark_primary_offline()
+        return list({item['tag'] for item in get_cached_items()})
     cursor = conn.cursor()
     cursor.execute("SELECT DISTINCT tag FROM items")
     tags = [row[0] for row in cursor.fetchall()]
     cursor.close()
-    return_connection(conn)
+    return_read_connection(conn)
     return tags
 
 
@@ -286,9 +816,12 @@ def add_location(name):
         name: Location name
         
     Returns:
-        True if successful, False if location already exists
+        True if successful, False if location already exists or the
+        database is unreachable (see is_primary_offline)
     """
-    conn = get_connection()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
     cursor = conn.cursor()
     
     try:
@@ -297,30 +830,34 @@ def add_location(name):
             (name,)
         )
         conn.commit()
-        cursor.close()
-        return_connection(conn)
-        # Invalidate cache
-        _CACHE['locations'] = None
-        return True
     except psycopg2.IntegrityError:
         conn.rollback()
+        return False
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    finally:
         cursor.close()
         return_connection(conn)
-        return False
+    _mark_write()
+    # Invalidate cache
+    invalidate_cache('locations')
+    return True
 
 
+@_read_with_fallback
 def get_all_locations():
     """Get all locations from database
     
     Returns:
         List of location names
     """
-    conn = get_connection()
+    conn = get_read_connection(shared=True)
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM locations ORDER BY name")
     locations = [row[0] for row in cursor.fetchall()]
     cursor.close()
-    return_connection(conn)
+    return_read_connection(conn)
     return locations
 
 
@@ -334,7 +871,11 @@ def update_merchant_sell_items(merchant_name, sell_items):
     Returns:
         True if successful, False otherwise
     """
-    conn = get_connection()
+    # A queued write committed after this one would overwrite it
+    flush_pending_writes()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
     cursor = conn.cursor()
     
     try:
@@ -344,13 +885,339 @@ def update_merchant_sell_items(merchant_name, sell_items):
         )
         conn.commit()
         success = cursor.rowcount > 0
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    except Exception:
+        conn.rollback()
+        return False
+    finally:
         cursor.close()
         return_connection(conn)
-        # Invalidate cache
-        _CACHE['merchants'] = None
-        return success
-    except Exception as e:
+    _mark_write()
+    # Invalidate cache
+    invalidate_cache('merchants')
+    return success
+
+
+def update_many_merchant_sell_items(sell_items_by_merchant):
+    """Update the sell items of several merchants in a single transaction
+
+    All rows go to the database as one batched UPDATE statement, so re-pricing
+    a whole market costs one round trip.
+
+    Args:
+        sell_items_by_merchant: Dictionary of merchant name -> list of [item_name, price] pairs
+
+    Returns:
+        True if every merchant was updated, False otherwise (nothing is changed)
+    """
+    if not sell_items_by_merchant:
+        return True
+    rows = [(name, json.dumps(sell_items)) for name, sell_items in sell_items_by_merchant.items()]
+    # A queued write committed after this one would overwrite it
+    flush_pending_writes()
+    conn = _get_write_connection()
+    if conn is None:
+        return False
+    cursor = conn.cursor()
+    
+    try:
+        execute_values(
+            cursor,
+            """
+            UPDATE merchants AS m
+            SET sell_items = v.sell_items
+            FROM (VALUES %s) AS v(name, sell_items)
+            WHERE m.name = v.name
+            """,
+            rows,
+            page_size=len(rows)
+        )
+        success = cursor.rowcount == len(rows)
+        if success:
+            conn.commit()
+        else:
+            # A merchant was deleted meanwhile; don't apply a partial edit
+            conn.rollback()
+    except psycopg2.OperationalError:
+        _write_failed(conn)
+        return False
+    except Exception:
         conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        return_connection(conn)
+    _mark_write()
+    # Invalidate cache
+    invalidate_cache('merchants')
+    return success
+
+
+
+# Optional write-behind pipeline (WRITE_BEHIND = true in secrets). Writes are
+# applied to the cache at once, queued, coalesced per merchant and flushed in
+# batched transactions by a background worker, instead of one transaction and
+# a full cache reload per click.
+
+# Seconds the worker waits after the first queued write, so a burst of edits
+# lands in one batch
+WRITE_BEHIND_DELAY = 0.5
+
+# (table, name) -> pending operation, in the order first queued
+_WRITE_QUEUE = OrderedDict()
+# Operations taken by the worker but not yet committed
+_INFLIGHT_WRITES = []
+# Session id -> error messages from failed flushes
+_WRITE_ERRORS = {}
+_write_lock = threading.Condition()
+_write_worker = None
+
+def is_write_behind_enabled():
+    """Return True if writes should go through the write-behind queue"""
+    return bool(st.secrets.get("WRITE_BEHIND", False))
+
+def _current_session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+def _apply_optimistic(op):
+    """Apply a queued operation to the cache; safe to apply more than once"""
+    global _CACHE_VERSION
+    if op['kind'] == 'add_location':
+        locations = _CACHE['locations']
+        if locations is not None and op['name'] not in locations:
+            _CACHE['locations'] = sorted(locations + [op['name']])
+    else:
+        merchants = _CACHE['merchants']
+        if merchants is None:
+            return
+        # Build new lists rather than mutating ones other sessions may be reading
+        if any(m['name'] == op['name'] for m in merchants):
+            _CACHE['merchants'] = [
+                dict(m, sell=op['sell']) if m['name'] == op['name'] else m
+                for m in merchants
+            ]
+        elif op['kind'] == 'add_merchant':
+            _CACHE['merchants'] = merchants + [{
+                'name': op['name'],
+                'location': op['location'] or '',
+                'buy': op['buy'],
+                'sell': op['sell']
+            }]
+            _index_merchant(op['name'], op['location'], op['buy'])
+    _CACHE_VERSION += 1
+
+def _enqueue_write(key, op):
+    """Queue an operation, merging it into a pending one for the same row"""
+    global _write_worker
+    pending = _WRITE_QUEUE.get(key)
+    if pending is not None:
+        # An add followed by updates still flushes as a single add
+        if 'sell' in op:
+            pending['sell'] = op['sell']
+        pending['sessions'] |= op['sessions']
+        op = pending
+    else:
+        _WRITE_QUEUE[key] = op
+    _apply_optimistic(op)
+    if _write_worker is None:
+        _write_worker = threading.Thread(target=_write_behind_worker, daemon=True)
+        _write_worker.start()
+    _write_lock.notify_all()
+
+def queue_add_location(name, session_id=None):
+    """Queue adding a location; see add_location"""
+    get_cached_locations()
+    with _write_lock:
+        _enqueue_write(('locations', name), {
+            'kind': 'add_location',
+            'name': name,
+            'sessions': {session_id or _current_session_id()}
+        })
+
+def queue_add_merchant(name, location, buy_tags, sell_items, session_id=None):
+    """Queue adding a merchant; see add_merchant
+
+    Returns:
+        False if the merchant already exists or is already queued, True otherwise.
+        A conflict only detected at flush time is reported via pop_write_errors.
+    """
+    merchants = get_cached_merchants()
+    with _write_lock:
+        if ('merchants', name) in _WRITE_QUEUE or any(m['name'] == name for m in merchants):
+            return False
+        _enqueue_write(('merchants', name), {
+            'kind': 'add_merchant',
+            'name': name,
+            'location': location,
+            'buy': buy_tags,
+            'sell': sell_items,
+            'sessions': {session_id or _current_session_id()}
+        })
+    return True
+
+def queue_update_merchant_sell_items(merchant_name, sell_items, session_id=None):
+    """Queue updating a merchant's sell items; see update_merchant_sell_items
+
+    Consecutive updates to the same merchant are merged into one write.
+
+    Returns:
+        False if the merchant is unknown, True otherwise
+    """
+    merchants = get_cached_merchants()
+    with _write_lock:
+        key = ('merchants', merchant_name)
+        if key not in _WRITE_QUEUE and not any(m['name'] == merchant_name for m in merchants):
+            return False
+        _enqueue_write(key, {
+            'kind': 'update_sell_items',
+            'name': merchant_name,
+            'sell': sell_items,
+            'sessions': {session_id or _current_session_id()}
+        })
+    return True
+
+def _drop_queued_writes(name):
+    """Drop the queued write for a merchant and wait out one being flushed
+
+    Returns:
+        True if the dropped write was adding the merchant
+    """
+    with _write_lock:
+        op = _WRITE_QUEUE.pop(('merchants', name), None)
+        _write_lock.wait_for(lambda: not any(
+            inflight['name'] == name and inflight['kind'] != 'add_location'
+            for inflight in _INFLIGHT_WRITES
+        ))
+    return op is not None and op['kind'] == 'add_merchant'
+
+def _report_write_error(op, message):
+    for session_id in op['sessions']:
+        _WRITE_ERRORS.setdefault(session_id, []).append(message)
+
+def _flush_writes(batch):
+    """Write a batch of queued operations in one transaction
+
+    Each kind of operation is one batched statement. Rows that conflict are
+    reported back to their sessions without failing the rest of the batch.
+
+    Returns:
+        True if some operations conflicted, so the optimistic cache is wrong
+    """
+    locations = [(op['name'],) for op in batch if op['kind'] == 'add_location']
+    adds = [op for op in batch if op['kind'] == 'add_merchant']
+    updates = [op for op in batch if op['kind'] == 'update_sell_items']
+    conn = _get_write_connection()
+    if conn is None:
+        raise psycopg2.OperationalError("database unreachable")
+    cursor = conn.cursor()
+    
+    try:
+        if locations:
+            execute_values(
+                cursor,
+                "INSERT INTO locations (name) VALUES %s ON CONFLICT (name) DO NOTHING",
+                locations,
+                page_size=len(locations)
+            )
+        inserted = set()
+        if adds:
+            rows = execute_values(
+                cursor,
+                "INSERT INTO merchants (name, location, buy_tags, sell_items) VALUES %s "
+                "ON CONFLICT (name) DO NOTHING RETURNING name",
+                [(op['name'], op['location'], json.dumps(op['buy']), json.dumps(op['sell'])) for op in adds],
+                page_size=len(adds),
+                fetch=True
+            )
+            inserted = {row[0] for row in rows}
+        updated = set()
+        if updates:
+            rows = execute_values(
+                cursor,
+                """
+                UPDATE merchants AS m
+                SET sell_items = v.sell_items
+                FROM (VALUES %s) AS v(name, sell_items)
+                WHERE m.name = v.name
+                RETURNING m.name
+                """,
+                [(op['name'], json.dumps(op['sell'])) for op in updates],
+                page_size=len(updates),
+                fetch=True
+            )
+            updated = {row[0] for row in rows}
+        conn.commit()
+    except Exception:
+        if conn.closed:
+            _mark_primary_offline()
+        else:
+            conn.rollback()
+        raise
+    finally:
         cursor.close()
         return_connection(conn)
-        return False
\ No newline at end of file
+    _mark_write({session_id for op in batch for session_id in op['sessions']})
+
+    with _write_lock:
+        failed = False
+        for op in adds:
+            if op['name'] not in inserted:
+                _report_write_error(op, f"Merchant '{op['name']}' already exists")
+                failed = True
+        for op in updates:
+            if op['name'] not in updated:
+                _report_write_error(op, f"Merchant '{op['name']}' no longer exists")
+                failed = True
+    return failed
+
+def _write_behind_worker():
+    """Background worker that flushes the write queue in batches"""
+    while True:
+        with _write_lock:
+            while not _WRITE_QUEUE:
+                _write_lock.wait()
+        time.sleep(WRITE_BEHIND_DELAY)
+        with _write_lock:
+            _INFLIGHT_WRITES[:] = _WRITE_QUEUE.values()
+            _WRITE_QUEUE.clear()
+        try:
+            stale = _flush_writes(_INFLIGHT_WRITES)
+        except Exception as e:
+            # Report rather than let a database error kill the worker
+            with _write_lock:
+                for op in _INFLIGHT_WRITES:
+                    _report_write_error(op, f"Could not save changes to '{op['name']}': {e}")
+            stale = True
+        with _write_lock:
+            _INFLIGHT_WRITES.clear()
+            _write_lock.notify_all()
+        if stale:
+            # Drop the optimistic state; the next read reloads from the database
+            invalidate_cache()
+
+def flush_pending_writes(timeout=None):
+    """Wait until every queued write has been flushed
+
+    Args:
+        timeout: Maximum seconds to wait, or None to wait indefinitely
+
+    Returns:
+        True if the queue drained, False on timeout
+    """
+    with _write_lock:
+        return _write_lock.wait_for(lambda: not _WRITE_QUEUE and not _INFLIGHT_WRITES, timeout)
+
+def pop_write_errors(session_id=None):
+    """Return and clear the write-behind errors for a session
+
+    Args:
+        session_id: Session to report on, defaults to the current one
+
+    Returns:
+        List of error messages
+    """
+    with _write_lock:
+        return _WRITE_ERRORS.pop(session_id or _current_session_id(), [])
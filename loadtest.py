@@ -0,0 +1,363 @@
+"""Concurrent-session load test for the merchant app.
+
+Drives N simulated sessions of apogea.py in parallel with Streamlit's AppTest,
+mixing page browsing, "Who Sells?" lookups and merchant writes against a
+PostgreSQL database, then reports throughput, rerun latency percentiles,
+connection pool saturation and cache reloads.
+
+All sessions share this process, like sessions on one Streamlit server, so
+they share the connection pool and the table cache in database.py.
+
+    python loadtest.py --sessions 20 --duration 60
+    python loadtest.py --database-url postgresql://localhost/merchants_test
+    python loadtest.py --database-url postgresql://primary/merchants \
+        --read-url postgresql://standby/merchants
+
+The pool figures are for the primary, so adding --read-url replicas shows how
+much read load moves off it.
+
+Without --database-url a throwaway cluster is started with initdb/pg_ctl from
+PATH (or --pg-bin). PostgreSQL refuses to run as root.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError
+import streamlit as st
+from streamlit import config
+from streamlit.runtime import Runtime
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import AppTest
+
+import database
+import migrations
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'apogea.py')
+
+# Action -> default share of the workload
+DEFAULT_MIX = {
+    'browse': 0.5,
+    'who_sells': 0.3,
+    'add_merchant': 0.05,
+    'update_sell_items': 0.15,
+}
+
+
+class LocalPostgres:
+    """Throwaway PostgreSQL cluster in a temporary directory"""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin
+        self.data_dir = None
+        self.port = None
+
+    def _tool(self, name):
+        path = os.path.join(self.pg_bin, name) if self.pg_bin else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise SystemExit(f"'{name}' not found; install PostgreSQL, pass --pg-bin or --database-url")
+        return path
+
+    @property
+    def url(self):
+        return f"postgresql://postgres@127.0.0.1:{self.port}/postgres"
+
+    def start(self):
+        self.data_dir = tempfile.mkdtemp(prefix='apogea-loadtest-')
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        subprocess.run(
+            [self._tool('initdb'), '-D', self.data_dir, '-U', 'postgres', '--auth=trust'],
+            check=True, capture_output=True
+        )
+        subprocess.run(
+            [self._tool('pg_ctl'), '-D', self.data_dir, '-w', '-l', os.path.join(self.data_dir, 'log'),
+             '-o', f"-p {self.port} -k {self.data_dir} -c listen_addresses=127.0.0.1", 'start'],
+            check=True, capture_output=True
+        )
+        return self
+
+    def stop(self):
+        if self.data_dir:
+            subprocess.run(
+                [self._tool('pg_ctl'), '-D', self.data_dir, '-m', 'fast', 'stop'],
+                capture_output=True
+            )
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+            self.data_dir = None
+
+
+def seed_database(url, items, merchants, locations, rng):
+    """Create the schema and fill it with generated test data
+
+    Returns:
+        List of generated item names
+    """
+    conn = psycopg2.connect(url)
+    migrations.migrate(conn)
+    cursor = conn.cursor()
+    tags = [f"tag-{i}" for i in range(max(items // 20, 1))]
+    item_rows = [(f"loadtest-item-{i}", round(rng.uniform(0.1, 20), 1), rng.choice(tags), '') for i in range(items)]
+    location_rows = [(f"loadtest-town-{i}",) for i in range(locations)]
+    merchant_rows = []
+    for i in range(merchants):
+        sold = rng.sample(item_rows, min(len(item_rows), rng.randint(1, 30)))
+        merchant_rows.append((
+            f"loadtest-merchant-{i}",
+            rng.choice(location_rows)[0],
+            json.dumps(rng.sample(tags, min(len(tags), 3))),
+            json.dumps([[item[0], rng.randint(1, 500)] for item in sold])
+        ))
+    execute_values(cursor, "INSERT INTO items (name, weight, tag, icon) VALUES %s ON CONFLICT DO NOTHING", item_rows)
+    execute_values(cursor, "INSERT INTO locations (name) VALUES %s ON CONFLICT DO NOTHING", location_rows)
+    execute_values(
+        cursor,
+        "INSERT INTO merchants (name, location, buy_tags, sell_items) VALUES %s ON CONFLICT DO NOTHING",
+        merchant_rows
+    )
+    conn.commit()
+    conn.close()
+    return [item[0] for item in item_rows]
+
+
+class Stats:
+    """Thread-safe collection of load test measurements"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.cache_reloads = 0
+        self.cache_reload_ms = 0.0
+        self.pool_samples = []
+
+    def record(self, action, ms):
+        with self.lock:
+            self.latencies[action].append(ms)
+
+    def error(self, kind):
+        with self.lock:
+            self.errors[kind] += 1
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of a list of numbers (nearest rank)"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def _timed_run(at, action, stats):
+    """Rerun a session, recording its latency and any exception"""
+    start = time.perf_counter()
+    try:
+        at.run()
+    except Exception as e:
+        stats.error(f"{action}: {type(e).__name__}")
+        return
+    stats.record(action, (time.perf_counter() - start) * 1000)
+    for exception in at.exception:
+        kind = 'pool exhausted' if 'pool exhausted' in exception.message else exception.message[:60]
+        stats.error(f"{action}: {kind}")
+
+
+def _share_apptest_state(secrets):
+    """Let AppTest sessions run in parallel threads
+
+    Each AppTest.run() installs a mock Runtime, swaps the global st.secrets and
+    turns on the global.appTest option, then undoes all three when it ends,
+    which breaks sessions that are still running. Secrets and the option are
+    set once for the whole process instead, and the most recent mock runtime
+    stays visible after a run clears it.
+    """
+    config.set_option("global.appTest", True)
+    shared = Secrets()
+    shared._secrets = secrets
+    st.secrets = shared
+
+    last = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            last['runtime'] = cls._instance
+            return cls._instance
+        if 'runtime' not in last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last['runtime']
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or 'runtime' in last)
+
+
+def run_session(session_id, item_names, mix, stop_at, stats, timeout, seed):
+    """Drive one simulated user until stop_at"""
+    rng = random.Random(seed + session_id)
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    _timed_run(at, 'browse', stats)
+
+    actions, weights = zip(*mix.items())
+    writes = 0
+    while time.monotonic() < stop_at:
+        action = rng.choices(actions, weights)[0]
+        try:
+            if action == 'who_sells':
+                selects = [s for s in at.selectbox if s.label == "Select Item to Search"]
+                if selects:
+                    selects[0].select(rng.choice(item_names))
+            elif action == 'add_merchant':
+                writes += 1
+                start = time.perf_counter()
+                database.add_merchant(
+                    f"loadtest-s{session_id}-{writes}", f"loadtest-town-{rng.randint(0, 9)}",
+                    ['tag-0'], [[rng.choice(item_names), rng.randint(1, 500)]]
+                )
+                stats.record('write', (time.perf_counter() - start) * 1000)
+            elif action == 'update_sell_items':
+                merchant = rng.choice(database.get_cached_merchants())
+                sell_items = merchant['sell'] + [[rng.choice(item_names), rng.randint(1, 500)]]
+                start = time.perf_counter()
+                database.update_merchant_sell_items(merchant['name'], sell_items[-30:])
+                stats.record('write', (time.perf_counter() - start) * 1000)
+        except PoolError:
+            stats.error(f"{action}: pool exhausted")
+            continue
+        except Exception as e:
+            stats.error(f"{action}: {type(e).__name__}")
+            continue
+        _timed_run(at, action, stats)
+
+
+def _watch_pool(stats, stop_event, interval):
+    """Sample how many pooled connections are checked out"""
+    while not stop_event.wait(interval):
+        pool = database.connection_pool
+        if pool is not None:
+            stats.pool_samples.append(len(pool._used))
+
+
+def _count_cache_reloads(stats):
+    """Wrap the cache loader to count reloads triggered by invalidation"""
+    original = database.load_all_tables_to_cache
+
+    def load_all_tables_to_cache():
+        start = time.perf_counter()
+        try:
+            return original()
+        finally:
+            with stats.lock:
+                stats.cache_reloads += 1
+                stats.cache_reload_ms += (time.perf_counter() - start) * 1000
+
+    database.load_all_tables_to_cache = load_all_tables_to_cache
+
+
+def print_report(stats, elapsed, sessions):
+    print(f"\n{'='*72}")
+    print(f"Load test - {sessions} sessions, {elapsed:.1f} s")
+    print(f"{'='*72}")
+    print(f"{'Action':<20} {'Count':>7} {'Per sec':>8} {'p50 ms':>9} {'p99 ms':>9} {'Max ms':>9}")
+    all_reruns = []
+    for action in sorted(stats.latencies):
+        values = stats.latencies[action]
+        if action != 'write':
+            all_reruns += values
+        print(f"{action:<20} {len(values):>7} {len(values) / elapsed:>8.1f} "
+              f"{percentile(values, 50):>9.1f} {percentile(values, 99):>9.1f} {max(values):>9.1f}")
+    if all_reruns:
+        print(f"{'all reruns':<20} {len(all_reruns):>7} {len(all_reruns) / elapsed:>8.1f} "
+              f"{percentile(all_reruns, 50):>9.1f} {percentile(all_reruns, 99):>9.1f} {max(all_reruns):>9.1f}")
+
+    pool = database.connection_pool
+    if stats.pool_samples and pool is not None:
+        saturated = sum(1 for used in stats.pool_samples if used >= pool.maxconn)
+        print(f"\nPool: max {max(stats.pool_samples)}/{pool.maxconn} connections in use, "
+              f"mean {sum(stats.pool_samples) / len(stats.pool_samples):.2f}, "
+              f"saturated {100 * saturated / len(stats.pool_samples):.1f}% of samples")
+    print(f"Cache reloads: {stats.cache_reloads} "
+          f"({stats.cache_reload_ms / max(stats.cache_reloads, 1):.1f} ms average)")
+    if stats.errors:
+        print("\nErrors:")
+        for kind, count in sorted(stats.errors.items(), key=lambda x: -x[1]):
+            print(f"  {count:>6}  {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the merchant app")
+    parser.add_argument('--sessions', type=int, default=10, help="Simulated sessions (default: 10)")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run (default: 30)")
+    parser.add_argument('--database-url', help="Use this database instead of starting a local one")
+    parser.add_argument('--read-url', action='append', default=[],
+                        help="Read replica of --database-url, may be repeated")
+    parser.add_argument('--pg-bin', help="Directory containing initdb and pg_ctl")
+    parser.add_argument('--items', type=int, default=300, help="Items to seed (default: 300)")
+    parser.add_argument('--merchants', type=int, default=100, help="Merchants to seed (default: 100)")
+    parser.add_argument('--locations', type=int, default=10, help="Locations to seed (default: 10)")
+    parser.add_argument('--mix', help="Action weights, e.g. browse=5,who_sells=3,add_merchant=1,update_sell_items=1")
+    parser.add_argument('--timeout', type=float, default=60, help="Per-rerun timeout in seconds (default: 60)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix = {}
+        for part in args.mix.split(','):
+            action, _, weight = part.partition('=')
+            if action not in DEFAULT_MIX:
+                parser.error(f"unknown action '{action}' in --mix")
+            mix[action] = float(weight)
+
+    if args.read_url and not args.database_url:
+        parser.error("--read-url needs --database-url (the replicas' primary)")
+
+    server = None
+    url = args.database_url
+    if not url:
+        server = LocalPostgres(args.pg_bin).start()
+        url = server.url
+    try:
+        item_names = seed_database(url, args.items, args.merchants, args.locations, random.Random(args.seed))
+        # Measure the primary, not the local replica
+        _share_apptest_state({
+            'DATABASE_URL': url,
+            'DATABASE_READ_URLS': args.read_url,
+            'LOCAL_REPLICA_PATH': ''
+        })
+        stats = Stats()
+        _count_cache_reloads(stats)
+        stop_event = threading.Event()
+        watcher = threading.Thread(target=_watch_pool, args=(stats, stop_event, 0.005), daemon=True)
+        watcher.start()
+
+        start = time.monotonic()
+        stop_at = start + args.duration
+        threads = [
+            threading.Thread(
+                target=run_session,
+                args=(i, item_names, mix, stop_at, stats, args.timeout, args.seed)
+            )
+            for i in range(args.sessions)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop_event.set()
+        print_report(stats, time.monotonic() - start, args.sessions)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
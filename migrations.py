@@ -0,0 +1,223 @@
+"""Versioned schema migrations for the merchant database.
+
+Migrations are applied in order and recorded in the ``schema_version`` table.
+The app brings the schema up to date once per process (see
+``database.initialize_database``); apply them at deploy time with:
+
+    python migrations.py              # apply pending migrations
+    python migrations.py --status     # show applied and pending migrations
+
+The database URL is taken from ``--database-url``, the ``DATABASE_URL``
+environment variable or ``.streamlit/secrets.toml``, in that order.
+"""
+
+import argparse
+import os
+
+import psycopg2
+
+# Key for pg_advisory_lock, so concurrent app instances and deploy jobs
+# don't apply the same migration twice
+ADVISORY_LOCK_ID = 0x41706F67
+
+# Ordered list of (version, description, SQL). Never edit an applied
+# migration; add a new one instead.
+MIGRATIONS = [
+    (1, "Create merchants, items and locations tables", '''
+        CREATE TABLE IF NOT EXISTS merchants (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            location TEXT,
+            buy_tags TEXT,
+            sell_items TEXT
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            weight REAL NOT NULL,
+            tag TEXT NOT NULL,
+            icon TEXT
+        );
+        CREATE TABLE IF NOT EXISTS locations (
+            id SERIAL PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        );
+    '''),
+    (2, "Add location column to merchants created before it existed", '''
+        ALTER TABLE merchants ADD COLUMN IF NOT EXISTS location TEXT;
+    '''),
+    (3, "Track updated_at and deleted rows for local replica sync", '''
+        ALTER TABLE merchants ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE items ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        ALTER TABLE locations ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+        CREATE INDEX IF NOT EXISTS merchants_updated_at_idx ON merchants (updated_at);
+        CREATE INDEX IF NOT EXISTS items_updated_at_idx ON items (updated_at);
+        CREATE INDEX IF NOT EXISTS locations_updated_at_idx ON locations (updated_at);
+        CREATE TABLE IF NOT EXISTS deleted_rows (
+            id SERIAL PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            name TEXT NOT NULL,
+            deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        CREATE INDEX IF NOT EXISTS deleted_rows_deleted_at_idx ON deleted_rows (deleted_at);
+        -- Triggers keep updated_at and the tombstones right for every change,
+        -- including manual SQL, not just the writes the app makes
+        CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = now();
+            -- A renamed row is gone under its old name
+            IF NEW.name IS DISTINCT FROM OLD.name THEN
+                INSERT INTO deleted_rows (table_name, name) VALUES (TG_TABLE_NAME, OLD.name);
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        CREATE OR REPLACE FUNCTION record_deleted_row() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_rows (table_name, name) VALUES (TG_TABLE_NAME, OLD.name);
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS merchants_touch_updated_at ON merchants;
+        CREATE TRIGGER merchants_touch_updated_at BEFORE UPDATE ON merchants
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS items_touch_updated_at ON items;
+        CREATE TRIGGER items_touch_updated_at BEFORE UPDATE ON items
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS locations_touch_updated_at ON locations;
+        CREATE TRIGGER locations_touch_updated_at BEFORE UPDATE ON locations
+            FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+        DROP TRIGGER IF EXISTS merchants_record_deleted ON merchants;
+        CREATE TRIGGER merchants_record_deleted AFTER DELETE ON merchants
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_row();
+        DROP TRIGGER IF EXISTS items_record_deleted ON items;
+        CREATE TRIGGER items_record_deleted AFTER DELETE ON items
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_row();
+        DROP TRIGGER IF EXISTS locations_record_deleted ON locations;
+        CREATE TRIGGER locations_record_deleted AFTER DELETE ON locations
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_row();
+    '''),
+    (4, "Index merchants by the tags they buy", '''
+        CREATE INDEX IF NOT EXISTS merchants_buy_tags_idx ON merchants USING GIN ((buy_tags::jsonb));
+    '''),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_current_version(conn):
+    """Return the schema version of the database, 0 if none was recorded
+
+    Args:
+        conn: Open database connection
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if cursor.fetchone()[0]:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        version = cursor.fetchone()[0]
+    else:
+        version = 0
+    cursor.close()
+    conn.rollback()
+    return version
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: the latest)
+
+    An up-to-date database only costs a version check, with no DDL. Otherwise
+    migrations run under an advisory lock, each in its own transaction.
+
+    Args:
+        conn: Open database connection
+        target: Version to migrate to, or None for the latest
+
+    Returns:
+        List of versions that were applied
+    """
+    target = LATEST_VERSION if target is None else target
+    if get_current_version(conn) >= target:
+        return []
+
+    cursor = conn.cursor()
+    applied = []
+    cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        conn.commit()
+        # Another process may have migrated while we waited for the lock
+        current = get_current_version(conn)
+        for version, description, sql in MIGRATIONS:
+            if current < version <= target:
+                try:
+                    cursor.execute(sql)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    conn.commit()
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+                applied.append(version)
+    finally:
+        # A failed statement aborts the transaction; clear it so the unlock
+        # runs and doesn't mask the original error. The lock is session-level,
+        # so it would otherwise stay held on a pooled connection. A lost
+        # connection already released it, and touching it would raise over
+        # the original error.
+        if not conn.closed:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+            conn.commit()
+            cursor.close()
+    return applied
+
+
+def _get_database_url(cli_url):
+    if cli_url:
+        return cli_url
+    if os.environ.get("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    import streamlit as st
+    return st.secrets.get("DATABASE_URL", "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the merchant database")
+    parser.add_argument('--database-url', help="PostgreSQL connection string")
+    parser.add_argument('--status', action='store_true', help="Show migration status and exit")
+    parser.add_argument('--target', type=int, help="Migrate up to this version (default: latest)")
+    args = parser.parse_args()
+
+    database_url = _get_database_url(args.database_url)
+    if not database_url:
+        parser.error("no database URL: pass --database-url, set DATABASE_URL or configure secrets")
+
+    conn = psycopg2.connect(database_url)
+    try:
+        if args.status:
+            current = get_current_version(conn)
+            for version, description, _ in MIGRATIONS:
+                state = "applied" if version <= current else "pending"
+                print(f"{version:>4}  {state:<8} {description}")
+            return
+        applied = migrate(conn, args.target)
+        if applied:
+            print(f"Applied migrations: {', '.join(map(str, applied))}")
+        else:
+            print(f"Database is up to date (version {get_current_version(conn)})")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
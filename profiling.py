@@ -0,0 +1,340 @@
+"""Opt-in profiling of the Streamlit render_* functions.
+
+Enable it with ``PROFILING = true`` in secrets for every session, or with
+``PROFILING = "query"`` for just the sessions opened with ``?profile=1``; the
+query parameter does nothing without the secret, since the sidebar can dump a
+process-wide profile. Each rerun then records, for every ``@profiled`` function, the
+wall time, widgets and elements created, DataFrames built and database
+connections taken. A debug sidebar shows the latest rerun as a flame-style
+breakdown, the recent history, and can dump pyinstrument (if installed) or
+cProfile output for a single rerun. Only one dump runs at a time per process.
+
+Usage in the app script:
+
+    begin_rerun()
+    ...  # render the page
+    end_rerun()
+"""
+
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import database
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Reruns kept in each session's history
+HISTORY_SIZE = 50
+
+# Per-thread profiling state; Streamlit runs each session's script in its own thread
+_local = threading.local()
+_hooks_lock = threading.Lock()
+_hooks_installed = False
+
+# Held while a cProfile/pyinstrument run is active. Since Python 3.12 cProfile
+# hooks every thread in the process and a second one fails to start, so other
+# sessions asking for a dump meanwhile are told to wait instead.
+_profiler_lock = threading.Lock()
+_profiler_state_lock = threading.Lock()
+# {'session', 'profiler', 'started'} of the active run, or None
+_profiler_run = None
+# A run left behind by a session that never reran is stopped after this long
+PROFILER_TIMEOUT = 300
+
+
+class _Frame:
+    """Measurements for one call of a profiled function"""
+
+    __slots__ = ('name', 'start', 'wall_ms', 'widgets', 'elements', 'dataframes', 'db_calls', 'children')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall_ms = 0.0
+        self.widgets = 0
+        self.elements = 0
+        self.dataframes = 0
+        self.db_calls = 0
+        self.children = []
+
+
+def _active_frames():
+    return getattr(_local, 'frames', None)
+
+
+def _count(attr):
+    """Add one to a counter of every active frame (counts are inclusive)"""
+    for frame in _active_frames() or ():
+        setattr(frame, attr, getattr(frame, attr) + 1)
+
+
+def _install_hooks():
+    """Wrap the Streamlit, pandas and database entry points we count, once per process
+
+    The wrappers only count while a rerun is being profiled on the calling
+    thread, so other sessions are unaffected.
+    """
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+
+        original_enqueue = DeltaGenerator._enqueue
+
+        @functools.wraps(original_enqueue)
+        def _enqueue(self, delta_type, element_proto, *args, **kwargs):
+            if _active_frames():
+                _count('elements')
+                # Widget protos carry a widget id; plain elements don't
+                if getattr(element_proto, 'id', ''):
+                    _count('widgets')
+            return original_enqueue(self, delta_type, element_proto, *args, **kwargs)
+
+        DeltaGenerator._enqueue = _enqueue
+
+        original_init = pd.DataFrame.__init__
+
+        @functools.wraps(original_init)
+        def _dataframe_init(self, *args, **kwargs):
+            if _active_frames():
+                # Only count DataFrames built by app code, not pandas or Streamlit internals
+                caller = sys._getframe(1).f_globals.get('__name__', '')
+                if not caller.startswith(('pandas', 'streamlit', 'pyarrow', 'numpy')):
+                    _count('dataframes')
+            original_init(self, *args, **kwargs)
+
+        pd.DataFrame.__init__ = _dataframe_init
+
+        # Reads routed to a replica never reach get_connection, so count both
+        for name in ('get_connection', 'get_read_connection'):
+            original = getattr(database, name)
+
+            @functools.wraps(original)
+            def _get_connection(*args, _original=original, **kwargs):
+                # Reads that fell back to the primary count once, not twice
+                if not getattr(_local, 'in_db_call', False):
+                    _count('db_calls')
+                _local.in_db_call = True
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    _local.in_db_call = False
+
+            setattr(database, name, _get_connection)
+        _hooks_installed = True
+
+
+def is_enabled():
+    """Return True if profiling is enabled for this session
+
+    ``PROFILING = true`` enables it for every session and ``PROFILING = "query"``
+    only for sessions opened with ``?profile=1``.
+    """
+    setting = st.secrets.get("PROFILING", False)
+    if setting == "query":
+        return st.query_params.get("profile") == "1"
+    return setting is True
+
+
+def profiled(func):
+    """Record wall time and counters for each call of a render function"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frames = _active_frames()
+        if not frames:
+            return func(*args, **kwargs)
+        frame = _Frame(func.__name__)
+        frames[-1].children.append(frame)
+        frames.append(frame)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            frame.wall_ms = (time.perf_counter() - frame.start) * 1000
+            frames.pop()
+    return wrapper
+
+
+def begin_rerun():
+    """Start profiling this rerun if profiling is enabled"""
+    # A rerun interrupted by st.rerun() or an error never reached end_rerun
+    dump = _stop_profiler()
+    if dump is not None:
+        st.session_state['_profile_dump'] = dump
+    _local.frames = None
+    if not is_enabled():
+        return
+    _install_hooks()
+    _local.frames = [_Frame('rerun')]
+
+    # A cProfile/pyinstrument dump was requested for this one rerun
+    engine = st.session_state.pop('_profile_next_rerun', None)
+    if engine and not _start_profiler(engine):
+        st.session_state['_profile_busy'] = True
+
+
+def _session_id():
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else None
+
+
+def _start_profiler(engine):
+    """Start a cProfile/pyinstrument run for this session
+
+    Returns:
+        False if another run (or another profiling tool) is already active
+    """
+    global _profiler_run
+    if not _profiler_lock.acquire(blocking=False):
+        return False
+    try:
+        if engine == 'pyinstrument' and pyinstrument is not None:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+    except ValueError:
+        # e.g. "Another profiling tool is already active" (a debugger, coverage)
+        _profiler_lock.release()
+        return False
+    with _profiler_state_lock:
+        _profiler_run = {'session': _session_id(), 'profiler': profiler, 'started': time.monotonic()}
+    return True
+
+
+def _stop_profiler():
+    """Stop this session's cProfile/pyinstrument run and return its text report
+
+    Also stops a run another session left behind for over PROFILER_TIMEOUT,
+    discarding its report, so profiling can't stay locked forever.
+    """
+    global _profiler_run
+    with _profiler_state_lock:
+        run = _profiler_run
+        if run is None:
+            return None
+        own = run['session'] == _session_id()
+        if not own and time.monotonic() - run['started'] < PROFILER_TIMEOUT:
+            return None
+        _profiler_run = None
+    profiler = run['profiler']
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            output = io.StringIO()
+            output.write(
+                "Process-wide cProfile run: includes every session's thread and the "
+                "background workers active during this rerun.\n\n"
+            )
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(60)
+            report = output.getvalue()
+        else:
+            profiler.stop()
+            report = profiler.output_text(unicode=True)
+    except Exception:
+        # Stopping a stale run from another thread may fail; just unlock
+        report = None
+    finally:
+        _profiler_lock.release()
+    return report if own else None
+
+
+def _flatten(frame, depth=0):
+    """Return a frame and its children as a depth-first list of dicts"""
+    rows = [{
+        'depth': depth,
+        'name': frame.name,
+        'wall_ms': frame.wall_ms,
+        'widgets': frame.widgets,
+        'elements': frame.elements,
+        'dataframes': frame.dataframes,
+        'db_calls': frame.db_calls,
+    }]
+    for child in frame.children:
+        rows += _flatten(child, depth + 1)
+    return rows
+
+
+def end_rerun():
+    """Finish profiling this rerun and show the debug sidebar"""
+    frames = _active_frames()
+    if not frames:
+        return
+    root = frames[0]
+    root.wall_ms = (time.perf_counter() - root.start) * 1000
+    _local.frames = None
+    dump = _stop_profiler()
+    if dump is not None:
+        st.session_state['_profile_dump'] = dump
+
+    if '_profile_history' not in st.session_state:
+        st.session_state['_profile_history'] = deque(maxlen=HISTORY_SIZE)
+    st.session_state['_profile_history'].append(_flatten(root))
+    _render_debug_sidebar()
+
+
+def _render_debug_sidebar():
+    """Render the latest rerun's breakdown, the history and the dump controls"""
+    history = st.session_state['_profile_history']
+    latest = history[-1]
+    total_ms = latest[0]['wall_ms'] or 1.0
+
+    with st.sidebar:
+        st.header("⏱️ Profiling")
+        st.caption(f"Last rerun: {latest[0]['wall_ms']:.1f} ms")
+        # Flame-style breakdown: one bar per call, indented by nesting depth
+        for row in latest:
+            indent = "\u2003" * row['depth']
+            st.progress(
+                min(row['wall_ms'] / total_ms, 1.0),
+                text=f"{indent}`{row['name']}` {row['wall_ms']:.1f} ms"
+            )
+
+        df = pd.DataFrame(latest[1:], columns=['name', 'wall_ms', 'widgets', 'elements', 'dataframes', 'db_calls'])
+        df['wall_ms'] = df['wall_ms'].round(1)
+        st.dataframe(df, hide_index=True, width='stretch')
+
+        if len(history) > 1:
+            st.subheader("History (ms)")
+            totals = []
+            for rerun in history:
+                # A function called several times in one rerun is summed
+                per_name = {}
+                for row in rerun:
+                    per_name[row['name']] = per_name.get(row['name'], 0.0) + row['wall_ms']
+                totals.append(per_name)
+            times = pd.DataFrame(totals)
+            st.line_chart(times)
+
+        st.subheader("Profile One Rerun")
+        if st.session_state.pop('_profile_busy', False):
+            st.warning("A profile is already in progress, possibly in another session. Try again shortly.")
+        # pyinstrument only samples this session's thread; cProfile sees the whole process
+        engines = (["pyinstrument"] if pyinstrument is not None else []) + ["cProfile"]
+        engine = st.radio("Profiler", options=engines, horizontal=True)
+        if st.button("🔬 Profile next rerun"):
+            st.session_state['_profile_next_rerun'] = engine
+            st.rerun()
+        if '_profile_dump' in st.session_state:
+            st.download_button(
+                "💾 Download profile",
+                data=st.session_state['_profile_dump'],
+                file_name="rerun_profile.txt",
+                mime="text/plain"
+            )
+            with st.expander("Show profile"):
+                st.code(st.session_state['_profile_dump'], language=None)
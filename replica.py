@@ -0,0 +1,232 @@
+"""Embedded SQLite replica of the merchant database.
+
+The app boots from this local copy so cold starts don't wait on the remote
+database, and keeps serving reads from it while the primary is unreachable.
+It catches up with the primary using ``updated_at`` watermarks, so only rows
+changed since the last sync cross the network. Deletes are picked up from the
+``deleted_rows`` tombstone table, which triggers on the primary keep up to date.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import streamlit as st
+
+DEFAULT_REPLICA_PATH = ".apogea_replica.sqlite3"
+
+# Rows committed slightly out of order can carry an updated_at just below the
+# watermark, so every sync re-reads this much overlap (upserts are idempotent)
+SYNC_OVERLAP_SECONDS = 5
+
+# Rows fetched per round trip when streaming a table from the primary, so a
+# full initial sync runs in constant memory
+SYNC_ITERSIZE = 2000
+
+# Primary table -> (columns synced, key column)
+SYNCED_TABLES = {
+    'locations': (('name',), 'name'),
+    'items': (('id', 'name', 'weight', 'tag', 'icon'), 'name'),
+    'merchants': (('name', 'location', 'buy_tags', 'sell_items'), 'name'),
+}
+
+
+def get_replica_path():
+    """Return the path of the local replica, or None if it is disabled
+
+    Set LOCAL_REPLICA_PATH to an empty string in secrets to disable it.
+    """
+    path = st.secrets.get("LOCAL_REPLICA_PATH", DEFAULT_REPLICA_PATH)
+    return path or None
+
+
+def is_enabled():
+    """Return True if the local replica is configured"""
+    return get_replica_path() is not None
+
+
+def _connect():
+    """Open the replica, creating its tables if needed"""
+    conn = sqlite3.connect(get_replica_path())
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS merchants (
+            name TEXT PRIMARY KEY,
+            location TEXT,
+            buy_tags TEXT,
+            sell_items TEXT,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER,
+            name TEXT PRIMARY KEY,
+            weight REAL NOT NULL,
+            tag TEXT NOT NULL,
+            icon TEXT,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS locations (
+            name TEXT PRIMARY KEY,
+            updated_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS sync_state (
+            table_name TEXT PRIMARY KEY,
+            watermark TEXT NOT NULL
+        );
+    ''')
+    return conn
+
+
+def has_data():
+    """Return True if the replica has been synced at least once"""
+    path = get_replica_path()
+    if path is None or not os.path.exists(path):
+        return False
+    conn = _connect()
+    try:
+        return conn.execute("SELECT 1 FROM sync_state LIMIT 1").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def load_tables():
+    """Load all tables from the replica
+
+    Returns:
+        Dictionary with 'merchants', 'items' and 'locations' in the same
+        shape as get_all_merchants, get_all_items and get_all_locations
+    """
+    conn = _connect()
+    try:
+        merchants = [
+            {
+                'name': row[0],
+                'location': row[1] or '',
+                'buy': json.loads(row[2]),
+                'sell': json.loads(row[3])
+            }
+            for row in conn.execute("SELECT name, location, buy_tags, sell_items FROM merchants")
+        ]
+        items = [
+            {
+                'id': row[0],
+                'name': row[1],
+                'weight': row[2],
+                'tag': row[3],
+                'icon': row[4]
+            }
+            for row in conn.execute("SELECT id, name, weight, tag, icon FROM items")
+        ]
+        locations = [row[0] for row in conn.execute("SELECT name FROM locations ORDER BY name")]
+    finally:
+        conn.close()
+    return {'merchants': merchants, 'items': items, 'locations': locations}
+
+
+def _get_watermark(conn, table):
+    row = conn.execute("SELECT watermark FROM sync_state WHERE table_name = ?", (table,)).fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+def _set_watermark(conn, table, watermark):
+    conn.execute(
+        "INSERT INTO sync_state (table_name, watermark) VALUES (?, ?) "
+        "ON CONFLICT (table_name) DO UPDATE SET watermark = excluded.watermark",
+        (table, watermark.isoformat())
+    )
+
+
+def sync_from_primary(pg_conn):
+    """Pull rows changed on the primary since the last sync into the replica
+
+    Tombstones are applied before upserts and only remove rows older than the
+    deletion, so a row that was deleted and then re-added ends up present, as
+    it is on the primary.
+
+    Args:
+        pg_conn: Open connection to the primary database
+
+    Returns:
+        Number of replica rows inserted, updated or deleted
+    """
+    conn = _connect()
+    pg_cursor = pg_conn.cursor()
+    changed = 0
+    try:
+        watermark = _get_watermark(conn, 'deleted_rows')
+        if watermark is None:
+            pg_cursor.execute("SELECT table_name, name, deleted_at FROM deleted_rows")
+        else:
+            pg_cursor.execute(
+                "SELECT table_name, name, deleted_at FROM deleted_rows "
+                "WHERE deleted_at > %s - make_interval(secs => %s)",
+                (watermark, SYNC_OVERLAP_SECONDS)
+            )
+        for table_name, name, deleted_at in pg_cursor.fetchall():
+            if table_name in SYNCED_TABLES:
+                key = SYNCED_TABLES[table_name][1]
+                changed += conn.execute(
+                    f"DELETE FROM {table_name} WHERE {key} = ? AND updated_at <= ?",
+                    (name, deleted_at.timestamp())
+                ).rowcount
+            watermark = max(watermark, deleted_at) if watermark else deleted_at
+        if watermark is not None:
+            _set_watermark(conn, 'deleted_rows', watermark)
+
+        for table, (columns, key) in SYNCED_TABLES.items():
+            column_list = ', '.join(columns)
+            watermark = _get_watermark(conn, table)
+            stream = pg_conn.cursor(name=f'sync_{table}')
+            stream.itersize = SYNC_ITERSIZE
+            if watermark is None:
+                stream.execute(f"SELECT {column_list}, updated_at FROM {table}")
+            else:
+                stream.execute(
+                    f"SELECT {column_list}, updated_at FROM {table} "
+                    "WHERE updated_at > %s - make_interval(secs => %s)",
+                    (watermark, SYNC_OVERLAP_SECONDS)
+                )
+            seen = {'changed': 0, 'newest': None}
+
+            def replica_rows(stream=stream, watermark=watermark, seen=seen):
+                for row in stream:
+                    # Rows re-read from the overlap window are not real changes
+                    if watermark is None or row[-1] > watermark:
+                        seen['changed'] += 1
+                    if seen['newest'] is None or row[-1] > seen['newest']:
+                        seen['newest'] = row[-1]
+                    yield row[:-1] + (row[-1].timestamp(),)
+
+            placeholders = ', '.join('?' for _ in columns)
+            updates = ', '.join(
+                f"{col} = excluded.{col}" for col in columns + ('updated_at',) if col != key
+            )
+            try:
+                conn.executemany(
+                    f"INSERT INTO {table} ({column_list}, updated_at) VALUES ({placeholders}, ?) "
+                    f"ON CONFLICT ({key}) DO UPDATE SET {updates}",
+                    replica_rows()
+                )
+            finally:
+                if not pg_conn.closed:
+                    stream.close()
+            changed += seen['changed']
+            newest = seen['newest']
+            if newest is not None:
+                watermark = max(watermark, newest) if watermark else newest
+            if watermark is not None:
+                _set_watermark(conn, table, watermark)
+            else:
+                # Empty table on the primary: record that it has been synced
+                _set_watermark(conn, table, datetime.fromtimestamp(0).astimezone())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if not pg_conn.closed:
+            pg_cursor.close()
+            # End the read transaction on the primary before the connection is reused
+            pg_conn.rollback()
+        conn.close()
+    return changed
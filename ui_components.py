@@ -1,13 +1,25 @@
 import streamlit as st
 import pandas as pd
 import os
+from profiling import profiled
 from database import (
     add_merchant, add_item, get_all_items, 
     delete_item, get_all_tags, add_location, delete_merchant,
-    update_merchant_sell_items,
-    get_cached_merchants, get_cached_items, get_cached_locations
+    update_merchant_sell_items, update_many_merchant_sell_items,
+    get_cached_merchants, get_cached_items, get_cached_locations,
+    get_buying_merchants, is_primary_offline,
+    is_write_behind_enabled, queue_add_location, queue_add_merchant,
+    queue_update_merchant_sell_items
 )
 
+def show_write_error(message):
+    """Show why a write failed, or that the database is offline"""
+    if is_primary_offline():
+        st.error("❌ Database unreachable. Changes can't be saved right now; try again shortly.")
+    else:
+        st.error(message)
+
+@profiled
 def render_add_merchant_form():
     """Render the form to add a new merchant"""
     st.header("➕ Add Merchant")
@@ -148,12 +160,17 @@ def render_add_merchant_form():
                 # Remove empty tags and duplicates
                 buy_tags_clean = list({tag.strip() for tag in buy_tags if tag.strip()})
                 
+                # Queue the writes instead if write-behind is enabled
+                write_behind = is_write_behind_enabled()
+                
                 # Add location to database if it's new
                 if location_option == "<Add new location>":
-                    add_location(merchant_location)
+                    (queue_add_location if write_behind else add_location)(merchant_location)
                 
                 # Add to database
-                success = add_merchant(merchant_name, merchant_location, buy_tags_clean, sell_items)
+                success = (queue_add_merchant if write_behind else add_merchant)(
+                    merchant_name, merchant_location, buy_tags_clean, sell_items
+                )
                 
                 if success:
                     st.success(f"✅ Merchant '{merchant_name}' added successfully!")
@@ -165,8 +182,9 @@ def render_add_merchant_form():
                     st.session_state.merchant_form_key += 1
                     st.rerun()
                 else:
-                    st.error(f"❌ Merchant '{merchant_name}' already exists")
+                    show_write_error(f"❌ Merchant '{merchant_name}' already exists")
 
+@profiled
 def render_merchants_list():
     """Render the list of all merchants"""
     st.header("📋 All Merchants")
@@ -177,7 +195,7 @@ def render_merchants_list():
         st.info("No merchants in database yet. Add one to get started!")
     else:
         # Get all items for the dropdown
-        items = get_all_items()
+        items = get_cached_items()
         item_names = [item['name'] for item in items]
         
         # Group merchants by location
@@ -256,11 +274,15 @@ def render_merchants_list():
                             if submitted and new_item:
                                 # Add the new item to the merchant's sell list
                                 updated_sell_items = merchant['sell'] + [[new_item, new_price]]
-                                if update_merchant_sell_items(merchant['name'], updated_sell_items):
+                                update = (
+                                    queue_update_merchant_sell_items if is_write_behind_enabled()
+                                    else update_merchant_sell_items
+                                )
+                                if update(merchant['name'], updated_sell_items):
                                     st.success(f"Added '{new_item}' to {merchant['name']}'s inventory")
                                     st.rerun()
                                 else:
-                                    st.error(f"Failed to add item to {merchant['name']}'s inventory")
+                                    show_write_error(f"Failed to add item to {merchant['name']}'s inventory")
                     
                     st.markdown("---")
                     
@@ -270,8 +292,9 @@ def render_merchants_list():
                             st.success(f"Deleted merchant '{merchant['name']}'")
                             st.rerun()
                         else:
-                            st.error(f"Failed to delete merchant '{merchant['name']}'")
+                            show_write_error(f"Failed to delete merchant '{merchant['name']}'")
 
+@profiled
 def render_add_item_form():
     """Render the form to add a new item"""
     st.header("➕ Add Item")
@@ -317,9 +340,10 @@ def render_add_item_form():
                     st.session_state.item_form_key += 1
                     st.rerun()
                 else:
-                    st.error(f"❌ Item '{item_name}' already exists")
+                    show_write_error(f"❌ Item '{item_name}' already exists")
 
 
+@profiled
 def render_items_list():
     """Render the list of all items, grouped by tag"""
     st.header("📦 All Items")
@@ -350,8 +374,9 @@ def render_items_list():
                                 st.success(f"Deleted item '{item['name']}'")
                                 st.rerun()
                             else:
-                                st.error(f"Failed to delete item '{item['name']}'")
+                                show_write_error(f"Failed to delete item '{item['name']}'")
 
+@profiled
 def render_merchants_selling_item_tab():
     """Tab to query which merchants sell a specific item and at what price"""
     st.header("🔎 Find Merchants Selling an Item")
@@ -376,4 +401,156 @@ def render_merchants_selling_item_tab():
             df = pd.DataFrame(results)
             st.dataframe(df, hide_index=True, width='stretch')
         else:
-            st.info(f"No merchants currently sell '{selected_item}'.")
\ No newline at end of file
+            st.info(f"No merchants currently sell '{selected_item}'.")
+
+@profiled
+def render_merchants_buying_items_tab():
+    """Tab to query which merchants buy a set of items, grouped by location"""
+    st.header("💰 Find Merchants Buying Your Items")
+    items = get_cached_items()
+    item_names = sorted(item['name'] for item in items)
+
+    selected_items = st.multiselect(
+        "Select Items to Sell",
+        options=item_names,
+        help="Pick one item or your whole inventory"
+    )
+    if selected_items:
+        buyers = get_buying_merchants(selected_items)
+        if not buyers:
+            st.info("No merchants currently buy any of the selected items.")
+            return
+        
+        for location in sorted(buyers):
+            st.subheader(f"📍 {location or 'Unknown Location'}")
+            results = [
+                {
+                    "Merchant": merchant,
+                    "Buys": ", ".join(sorted(bought)),
+                    "Count": len(bought)
+                }
+                for merchant, bought in buyers[location].items()
+            ]
+            results.sort(key=lambda x: (-x["Count"], x["Merchant"]))
+            df = pd.DataFrame(results)
+            st.dataframe(df, hide_index=True, width='stretch')
+        
+        sellable = {item for merchants in buyers.values() for bought in merchants.values() for item in bought}
+        unsold = [item for item in selected_items if item not in sellable]
+        if unsold:
+            st.warning(f"Nobody buys: {', '.join(unsold)}")
+
+def compute_price_changes(merchants, edited_df):
+    """Diff an edited price grid against the cached merchants
+
+    Args:
+        merchants: Merchants shown in the grid (as returned by get_cached_merchants)
+        edited_df: DataFrame with Merchant, Item and Price columns after editing
+
+    Returns:
+        (changes, errors) where changes maps merchant name -> new list of
+        [item_name, price] pairs for merchants whose inventory changed, and
+        errors is a list of messages for rows that can't be saved
+    """
+    errors = []
+    edited = {}
+    for row in edited_df.itertuples(index=False):
+        if pd.isna(row.Merchant) or pd.isna(row.Item):
+            errors.append("Every row needs a merchant and an item")
+            continue
+        if pd.isna(row.Price) or row.Price < 0:
+            errors.append(f"Invalid price for '{row.Item}' at {row.Merchant}")
+            continue
+        prices = edited.setdefault(row.Merchant, {})
+        if row.Item in prices:
+            errors.append(f"'{row.Item}' is listed twice for {row.Merchant}")
+            continue
+        prices[row.Item] = int(row.Price)
+
+    changes = {}
+    merchants_by_name = {merchant['name']: merchant for merchant in merchants}
+    for name in merchants_by_name.keys() | edited.keys():
+        current = merchants_by_name.get(name, {}).get('sell', [])
+        prices = edited.get(name, {})
+        # Keep the existing order, then append newly added items
+        new_sell = [[item, prices[item]] for item, _ in current if item in prices]
+        existing = {item for item, _ in current}
+        new_sell += [[item, price] for item, price in prices.items() if item not in existing]
+        if new_sell != [[item, int(price)] for item, price in current]:
+            changes[name] = new_sell
+    return changes, errors
+
+@profiled
+def render_bulk_price_editor():
+    """Render an editable grid of every merchant's inventory and prices"""
+    st.header("✏️ Edit Prices")
+    
+    merchants = get_cached_merchants()
+    if not merchants:
+        st.info("No merchants in database yet. Add one to get started!")
+        return
+    
+    # Incremented after a save so the editor starts from the fresh data
+    if 'price_editor_key' not in st.session_state:
+        st.session_state.price_editor_key = 0
+    
+    locations = sorted({merchant['location'] for merchant in merchants})
+    selected_locations = st.multiselect("Filter by Location", options=locations)
+    if selected_locations:
+        merchants = [m for m in merchants if m['location'] in selected_locations]
+    
+    rows = [
+        {"Merchant": merchant['name'], "Location": merchant['location'], "Item": item, "Price": int(price)}
+        for merchant in sorted(merchants, key=lambda x: (x['location'], x['name']))
+        for item, price in merchant['sell']
+    ]
+    df = pd.DataFrame(rows, columns=["Merchant", "Location", "Item", "Price"])
+    item_names = sorted(item['name'] for item in get_cached_items())
+    
+    edited_df = st.data_editor(
+        df,
+        num_rows="dynamic",
+        hide_index=True,
+        width='stretch',
+        disabled=["Location"],
+        column_config={
+            "Merchant": st.column_config.SelectboxColumn(
+                options=sorted(m['name'] for m in merchants), required=True
+            ),
+            "Item": st.column_config.SelectboxColumn(options=item_names, required=True),
+            "Price": st.column_config.NumberColumn(min_value=0, step=1, format="%d", required=True),
+        },
+        key=f"price_editor_{st.session_state.price_editor_key}"
+    )
+    
+    changes, errors = compute_price_changes(merchants, edited_df)
+    for error in dict.fromkeys(errors):
+        st.error(error)
+    
+    if st.button(
+        f"💾 Save Changes ({len(changes)} merchants)",
+        type="primary",
+        disabled=not changes or bool(errors)
+    ):
+        if is_write_behind_enabled():
+            # Queued like other edits, so they are saved in the order made.
+            # Each merchant is queued on its own, so report the ones that failed
+            failed = [
+                name for name, sell in changes.items()
+                if not queue_update_merchant_sell_items(name, sell)
+            ]
+            if failed and len(failed) < len(changes):
+                st.error(
+                    f"Updated prices for {len(changes) - len(failed)} merchants. These merchants "
+                    f"no longer exist and were skipped: {', '.join(failed)}"
+                )
+                return
+            saved = not failed
+        else:
+            saved = update_many_merchant_sell_items(changes)
+        if saved:
+            st.success(f"Updated prices for {len(changes)} merchants")
+            st.session_state.price_editor_key += 1
+            st.rerun()
+        else:
+            show_write_error("Failed to save changes. A merchant may have been deleted; nothing was saved.")
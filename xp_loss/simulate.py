@@ -0,0 +1,202 @@
+"""Simulate a population of players moving through an XP curve.
+
+Every player gains XP each hour they play and can die, losing 10% of their
+total XP (see apogea.py) and possibly dropping a level. The whole population
+is advanced at once as NumPy arrays, optionally split across processes, and
+the level distribution is reported at regular snapshots.
+
+    python simulate.py --players 1000000 --hours 500 --workers 8
+    python simulate.py --curve linear --output distribution.csv
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+CURVES = {
+    'linear': 'xp_loss_linear.csv',
+    'exponential': 'xp_loss_exponential.csv',
+}
+
+# Fraction of total XP lost on death
+DEATH_LOSS = 0.1
+
+# Players advanced together per array pass; bounds memory per worker
+BATCH_SIZE = 250_000
+
+
+def load_curve(name):
+    """Return the cumulative XP needed to finish each level of a curve"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), CURVES[name])
+    with open(path, newline='') as csvfile:
+        return np.array([float(row['total_xp']) for row in csv.DictReader(csvfile)])
+
+
+def levels_for(thresholds, experience):
+    """Return the level of each player given their total XP"""
+    return np.minimum(np.searchsorted(thresholds, experience, side='right') + 1, len(thresholds))
+
+
+def simulate_batch(thresholds, players, hours, snapshot_every, params, seed):
+    """Advance one batch of players through the curve
+
+    Args:
+        thresholds: Cumulative XP needed to finish each level
+        players: Number of players in the batch
+        hours: Number of simulated hours
+        snapshot_every: Hours between level distribution snapshots
+        params: Dictionary with xp_per_hour, level_exponent, skill_sigma,
+            death_rate and mean_activity
+        seed: Seed for this batch's random generator
+
+    Returns:
+        (distribution, deaths, delevels) where distribution has one row of
+        per-level player counts for each snapshot
+    """
+    rng = np.random.default_rng(seed)
+    max_level = len(thresholds)
+    # Per-player traits: how fast they earn XP and how often they play
+    skill = rng.lognormal(0.0, params['skill_sigma'], players)
+    activity = rng.beta(2.0, 2.0 * (1 - params['mean_activity']) / params['mean_activity'], players)
+    experience = np.zeros(players)
+    level = np.ones(players, dtype=np.int64)
+
+    distribution = np.zeros((hours // snapshot_every, max_level), dtype=np.int64)
+    deaths = 0
+    delevels = 0
+    for hour in range(1, hours + 1):
+        playing = rng.random(players) < activity
+        gain = params['xp_per_hour'] * skill * level ** params['level_exponent']
+        experience += np.where(playing, gain * rng.exponential(1.0, players), 0.0)
+
+        died = playing & (rng.random(players) < params['death_rate'])
+        experience[died] *= 1 - DEATH_LOSS
+        deaths += int(died.sum())
+
+        new_level = levels_for(thresholds, experience)
+        delevels += int((new_level < level).sum())
+        level = new_level
+
+        if hour % snapshot_every == 0:
+            distribution[hour // snapshot_every - 1] = np.bincount(level - 1, minlength=max_level)
+    return distribution, deaths, delevels
+
+
+def _run_chunk(args):
+    """Run one worker's share of the population in memory-bounded batches"""
+    thresholds, players, hours, snapshot_every, params, seed_seq = args
+    seeds = seed_seq.spawn(-(-players // BATCH_SIZE))
+    total = None
+    deaths = delevels = 0
+    for start, seed in zip(range(0, players, BATCH_SIZE), seeds):
+        size = min(BATCH_SIZE, players - start)
+        distribution, batch_deaths, batch_delevels = simulate_batch(
+            thresholds, size, hours, snapshot_every, params, seed
+        )
+        total = distribution if total is None else total + distribution
+        deaths += batch_deaths
+        delevels += batch_delevels
+    return total, deaths, delevels
+
+
+def simulate(curve, players, hours, snapshot_every, params, workers=1, seed=None):
+    """Simulate a population on a curve, splitting it across worker processes
+
+    Returns:
+        (distribution, deaths, delevels) summed over all workers
+    """
+    thresholds = load_curve(curve)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    shares = [players // workers + (i < players % workers) for i in range(workers)]
+    jobs = [
+        (thresholds, share, hours, snapshot_every, params, seed_seq)
+        for share, seed_seq in zip(shares, seeds) if share
+    ]
+    if workers == 1:
+        results = [_run_chunk(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_run_chunk, jobs))
+
+    distribution = sum(result[0] for result in results)
+    return distribution, sum(r[1] for r in results), sum(r[2] for r in results)
+
+
+def summarize(distribution):
+    """Return (mean, median, p90) level for each snapshot"""
+    levels = np.arange(1, distribution.shape[1] + 1)
+    counts = distribution.sum(axis=1, keepdims=True)
+    mean = (distribution * levels).sum(axis=1) / counts[:, 0]
+    cumulative = distribution.cumsum(axis=1) / counts
+    median = (cumulative < 0.5).sum(axis=1) + 1
+    p90 = (cumulative < 0.9).sum(axis=1) + 1
+    return mean, median, p90
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate players levelling through the XP curves")
+    parser.add_argument('--curve', choices=sorted(CURVES), action='append',
+                        help="Curve to simulate, may be repeated (default: all)")
+    parser.add_argument('--players', type=int, default=100_000, help="Population size (default: 100000)")
+    parser.add_argument('--hours', type=int, default=300, help="Simulated hours (default: 300)")
+    parser.add_argument('--snapshot-every', type=int, default=50,
+                        help="Hours between reported distributions (default: 50)")
+    parser.add_argument('--xp-per-hour', type=float, default=60.0,
+                        help="Average XP per played hour at level 1 (default: 60)")
+    parser.add_argument('--level-exponent', type=float, default=1.5,
+                        help="XP per hour grows as level ** exponent (default: 1.5)")
+    parser.add_argument('--skill-sigma', type=float, default=0.5,
+                        help="Spread of per-player XP rates, lognormal sigma (default: 0.5)")
+    parser.add_argument('--death-rate', type=float, default=0.02,
+                        help="Chance of dying per played hour (default: 0.02)")
+    parser.add_argument('--mean-activity', type=float, default=0.3,
+                        help="Average fraction of hours a player plays (default: 0.3)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible runs")
+    parser.add_argument('--output', help="Write the level distributions to this CSV file")
+    args = parser.parse_args()
+
+    if not 0 < args.mean_activity < 1:
+        parser.error("--mean-activity must be between 0 and 1")
+    if not 0 < args.snapshot_every <= args.hours:
+        parser.error("--snapshot-every must be between 1 and --hours")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    params = {
+        'xp_per_hour': args.xp_per_hour,
+        'level_exponent': args.level_exponent,
+        'skill_sigma': args.skill_sigma,
+        'death_rate': args.death_rate,
+        'mean_activity': args.mean_activity,
+    }
+    rows = []
+    for curve in args.curve or sorted(CURVES):
+        distribution, deaths, delevels = simulate(
+            curve, args.players, args.hours, args.snapshot_every, params, args.workers, args.seed
+        )
+        mean, median, p90 = summarize(distribution)
+        print(f"\n{'='*60}")
+        print(f"{curve} curve - {args.players} players, {deaths} deaths, {delevels} de-levels")
+        print(f"{'='*60}")
+        print(f"{'Hour':>6} {'Mean':>7} {'Median':>7} {'P90':>5}  {'Max level':>9}")
+        for i, hour in enumerate(range(args.snapshot_every, args.hours + 1, args.snapshot_every)):
+            top = int(distribution[i, -1])
+            print(f"{hour:>6} {mean[i]:>7.2f} {median[i]:>7} {p90[i]:>5}  {top:>9}")
+            rows += [
+                [curve, hour, lvl, int(count)]
+                for lvl, count in enumerate(distribution[i], start=1)
+            ]
+
+    if args.output:
+        with open(args.output, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['curve', 'hour', 'lvl', 'players'])
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()